@@ -2,107 +2,103 @@ import re
 import argparse
 import sys
 import os
+import mmap
 import tempfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 模块级预编译正则（热循环中避免每次查 re 缓存） ---
+_GROUP_TITLE_RE = re.compile(r'group-title="([^"]*)"')
+_EXTM3U_RE = re.compile(r'^[ \t]*#EXTM3U[^\n]*', re.MULTILINE)
+# 一个条目 = EXTINF 行 + 其后直到下一个 EXTINF/EXTM3U 的所有行（配置行、URL等）
+_ENTRY_RE = re.compile(
+    r'^[ \t]*(#EXTINF:[^\n]*)\n?'
+    r'((?:[ \t]*(?!#EXT(?:INF:|M3U))[^\n]*\n?)*)',
+    re.MULTILINE)
 
 # --- 辅助函数：提取 Group-Title ---
 def extract_group_title(info_line):
     """从 #EXTINF 行中提取 group-title 的值。"""
-    match = re.search(r'group-title="([^"]*)"', info_line)
+    match = _GROUP_TITLE_RE.search(info_line)
     if match:
         return match.group(1).strip()
     return ""
 
-# --- 辅助函数：解析单个 M3U 内容 (支持多URL) ---
-def parse_single_m3u(m3u_content):
-    if not m3u_content:
-        return [], {}, ""
-        
-    lines = [line.strip() for line in m3u_content.strip().split('\n') if line.strip()]
-    
-    # channels_map 结构: { ("频道名称", "Group-Title"): {"info": "#EXTINF...", "urls": set()} }
+# --- 辅助函数：解析单个 M3U 文件 (支持多URL) ---
+def parse_single_m3u_file(file_path):
+    # channels_map 结构: { ("频道名称", "Group-Title"): {"info": "#EXTINF...", "urls": [...]} }
+    # URL 去重统一走一个大 set，避免为每个频道分配一个小 set
     channels_map = {}
     order_list = [] # 包含 ("频道名称", "Group-Title") 复合键
+    seen_urls = set() # (channel_key, url)
     header = ""
-    
-    current_info_line = None
-    current_channel_name = None
-    current_group_title = None
-    current_config_lines = []  # 存储配置行
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        
-        if line.startswith('#EXTM3U'):
-            if not header:
-                header = line
-            i += 1
+
+    # 整块读入后用一个预编译正则 finditer 扫描所有条目，
+    # 把逐行的 Python 分发循环下沉到 C 实现的正则引擎
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    header_match = _EXTM3U_RE.search(content)
+    if header_match:
+        header = header_match.group(0).strip()
+
+    for entry_match in _ENTRY_RE.finditer(content):
+        info_line = entry_match.group(1).strip()
+        # 频道名就是最后一个逗号之后的部分，rpartition 比正则快得多
+        _, sep, name_tail = info_line.rpartition(',')
+        if not sep:
+            continue  # 无频道名的条目，整体跳过
+        # 频道名/组名会作为字典键反复参与哈希比较，intern 去重
+        channel_name = sys.intern(name_tail.strip())
+        if not channel_name:
             continue
+        group_title = sys.intern(extract_group_title(info_line))
+        channel_key = (channel_name, group_title)
 
-        if line.startswith('#EXTINF:'):
-            # 如果之前有频道数据，先保存
-            if current_info_line and current_channel_name:
-                channel_key = (current_channel_name, current_group_title)
-                
-                if channel_key not in channels_map:
-                    channels_map[channel_key] = {
-                        "info": current_info_line, 
-                        "urls": set(),
-                        "configs": list(current_config_lines)  # 保存配置行
-                    }
-                    order_list.append(channel_key)
-                else:
-                    # 合并到已存在的频道
-                    channels_map[channel_key]["info"] = current_info_line
-                    channels_map[channel_key]["configs"].extend(current_config_lines)
-            
-            # 开始新频道
-            current_info_line = line
-            name_match = re.search(r',(.+)$', line)
-            current_channel_name = name_match.group(1).strip() if name_match else None
-            current_group_title = extract_group_title(current_info_line)
-            current_config_lines = []  # 重置配置行
-            i += 1
-            
-        elif line.startswith('#') and not line.startswith('#EXTINF:'):
-            # 收集配置行（如#EXTVLCOPT）
-            current_config_lines.append(line)
-            i += 1
-            
-        elif line.startswith(('http://', 'https://')):
-            # URL 属于最近解析成功的频道实体
-            if current_channel_name and current_group_title is not None:
-                channel_key = (current_channel_name, current_group_title)
-                if channel_key not in channels_map:
-                    # 如果还没有创建频道实体，先创建
-                    channels_map[channel_key] = {
-                        "info": current_info_line, 
-                        "urls": set(),
-                        "configs": list(current_config_lines)
-                    }
-                    order_list.append(channel_key)
-                channels_map[channel_key]["urls"].add(line)
-            i += 1
-            
-        else:
-            # 未知行，跳过
-            i += 1
-    
-    # 处理最后一个频道
-    if current_info_line and current_channel_name:
-        channel_key = (current_channel_name, current_group_title)
-        
-        if channel_key not in channels_map:
+        # 逐行消化条目内的配置行与URL行（通常只有寥寥数行）
+        config_lines = []
+        entry = None
+        for raw_line in entry_match.group(2).splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+            if line[0] == '#':
+                # 收集配置行（如#EXTVLCOPT）
+                config_lines.append(line)
+            elif line.startswith(('http://', 'https://')):
+                # 同一 URL 常在多个文件中重复出现，intern 后
+                # 重复串共享同一对象，比较退化为指针比较
+                line = sys.intern(line)
+                if entry is None:
+                    entry = channels_map.get(channel_key)
+                    if entry is None:
+                        # 如果还没有创建频道实体，先创建
+                        entry = {
+                            "info": info_line,
+                            "urls": [],
+                            "configs": list(config_lines)
+                        }
+                        channels_map[channel_key] = entry
+                        order_list.append(channel_key)
+                url_key = (channel_key, line)
+                if url_key not in seen_urls:
+                    seen_urls.add(url_key)
+                    entry["urls"].append(line)
+            # 其余未知行直接跳过
+
+        # 条目收尾：保存/合并频道数据
+        entry = channels_map.get(channel_key)  # 只做一次哈希查找
+        if entry is None:
             channels_map[channel_key] = {
-                "info": current_info_line, 
-                "urls": set(),
-                "configs": list(current_config_lines)
+                "info": info_line,
+                "urls": [],
+                "configs": config_lines  # 保存配置行
             }
             order_list.append(channel_key)
         else:
-            channels_map[channel_key]["info"] = current_info_line
-            channels_map[channel_key]["configs"].extend(current_config_lines)
+            # 合并到已存在的频道
+            entry["info"] = info_line
+            entry["configs"].extend(config_lines)
 
     return order_list, channels_map, header
 
@@ -124,16 +120,22 @@ def safe_write_output(content, input_files, output_path):
             fd, temp_path = tempfile.mkstemp(
                 dir=output_dir,
                 suffix='.m3u',
-                prefix='.tmp_',
-                text=True
+                prefix='.tmp_'
             )
-            out_f = os.fdopen(fd, 'w', encoding='utf-8')
         else:
-            out_f = open(output_path, 'w', encoding='utf-8')
-        
-        with out_f:
-            out_f.write(content)
-        
+            fd = os.open(output_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        # 输出总长度已知，ftruncate 后通过 mmap 一次性落盘，
+        # 省去用户态缓冲区的再拷贝
+        data = content.encode('utf-8')
+        try:
+            os.ftruncate(fd, len(data))
+            if data:
+                with mmap.mmap(fd, len(data)) as mm:
+                    mm[:] = data
+        finally:
+            os.close(fd)
+
         if is_output_in_inputs:
             try:
                 os.replace(temp_path, output_path)
@@ -222,7 +224,9 @@ def main():
             sys.exit(1)
     
     final_channels_data = {}
-    group_global_order = [] 
+    group_global_order = []
+    # 跨文件的 URL 去重：一个全局 set，键为 (组, 频道名, url)
+    merged_url_seen = set()
     final_header = ""
     
     valid_input_files = []
@@ -230,15 +234,18 @@ def main():
         if not os.path.exists(input_file):
             print(f"警告: 输入文件 '{input_file}' 不存在。跳过。", file=sys.stderr)
             continue
-            
+
         valid_input_files.append(input_file)
-        
+
+    # 并发解析所有输入文件（文件读取会释放 GIL，可叠加磁盘延迟），
+    # 结果仍按命令行顺序依次合并，保证输出顺序不变
+    with ThreadPoolExecutor(max_workers=min(32, len(valid_input_files)) or 1) as executor:
+        parse_futures = [executor.submit(parse_single_m3u_file, f) for f in valid_input_files]
+
+    for input_file, parse_future in zip(valid_input_files, parse_futures):
         try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            current_order_list, current_map, header = parse_single_m3u(content)
-            
+            current_order_list, current_map, header = parse_future.result()
+
             if not final_header and header:
                 final_header = header
             
@@ -253,45 +260,62 @@ def main():
 
             for group_title, current_group_items in current_groups.items():
                 if group_title not in final_channels_data:
-                    final_channels_data[group_title] = {"channels": {}, "order_list": []}
+                    # pos_map: 频道名 -> 在 order_list 中的下标，避免 O(N) 的 list.index 扫描
+                    final_channels_data[group_title] = {"channels": {}, "order_list": [], "pos_map": {}}
                     group_global_order.append(group_title)
-                
+
                 final_group_data = final_channels_data[group_title]
                 final_group_channels = final_group_data["channels"]
                 final_group_order = final_group_data["order_list"]
+                final_group_pos = final_group_data["pos_map"]
                 
                 last_known_channel_index = -1
+                # 锚点下标 -> 待插入的新频道名，文件处理完后一次性拼接，
+                # 避免每个新频道一次 O(N) 的 list.insert 搬移
+                pending_inserts = {}
 
                 for channel_key, current_channel_data in current_group_items:
                     channel_name, _ = channel_key
                     
-                    if channel_name in final_group_channels:
+                    final_entry = final_group_channels.get(channel_name)
+                    if final_entry is not None:
                         # 合并：更新info，合并URL和配置行
-                        final_group_channels[channel_name]["info"] = current_channel_data["info"]
-                        final_group_channels[channel_name]["urls"].update(current_channel_data["urls"])
-                        
+                        final_entry["info"] = current_channel_data["info"]
+                        for url in current_channel_data["urls"]:
+                            url_key = (group_title, channel_name, url)
+                            if url_key not in merged_url_seen:
+                                merged_url_seen.add(url_key)
+                                final_entry["urls"].append(url)
+
                         # 合并配置行（去重）
-                        existing_configs = final_group_channels[channel_name].get("configs", [])
+                        existing_configs = final_entry.get("configs", [])
                         new_configs = current_channel_data.get("configs", [])
                         all_configs = list(set(existing_configs + new_configs))
-                        final_group_channels[channel_name]["configs"] = all_configs
-                        
-                        try:
-                            last_known_channel_index = final_group_order.index(channel_name)
-                        except ValueError:
-                            pass
+                        final_entry["configs"] = all_configs
+
+                        last_known_channel_index = final_group_pos[channel_name]
                             
                     else:
                         # 新频道：添加
                         final_group_channels[channel_name] = {
-                            "info": current_channel_data["info"], 
+                            "info": current_channel_data["info"],
                             "urls": current_channel_data["urls"],
                             "configs": current_channel_data.get("configs", [])
                         }
-                        
-                        insert_index = last_known_channel_index + 1
-                        final_group_order.insert(insert_index, channel_name)
-                        last_known_channel_index = insert_index
+                        for url in current_channel_data["urls"]:
+                            merged_url_seen.add((group_title, channel_name, url))
+
+                        pending_inserts.setdefault(last_known_channel_index, []).append(channel_name)
+
+                # 一次性把新频道拼接到各自锚点之后，并重建下标映射
+                if pending_inserts:
+                    new_order = list(pending_inserts.get(-1, ()))
+                    for pos, name in enumerate(final_group_order):
+                        new_order.append(name)
+                        if pos in pending_inserts:
+                            new_order.extend(pending_inserts[pos])
+                    final_group_data["order_list"] = new_order
+                    final_group_data["pos_map"] = {name: pos for pos, name in enumerate(new_order)}
                         
         except Exception as e:
             print(f"处理文件 '{input_file}' 时发生错误: {e}", file=sys.stderr)
@@ -299,26 +323,28 @@ def main():
 
     # 生成最终内容
     output_lines = [final_header] if final_header else []
-    
+    # 绑定方法 + extend 批量追加，减少热循环里的属性查找和逐项 append
+    append_line = output_lines.append
+    extend_lines = output_lines.extend
+    keep_configs = not args.no_config
+
     for group_title in group_global_order:
         if group_title in final_channels_data:
             group_data = final_channels_data[group_title]
-            
+
             for name in group_data["order_list"]:
                 if name in group_data["channels"]:
                     data = group_data["channels"][name]
-                    
-                    output_lines.append(data["info"])
-                    
+
+                    append_line(data["info"])
+
                     # 写入配置行（如果启用）
-                    if not args.no_config and data.get("configs"):
-                        for config in data["configs"]:
-                            output_lines.append(config)
-                    
-                    # 写入URL行（排序后）
-                    for url in sorted(list(data["urls"])):
-                        output_lines.append(url)
-                
+                    if keep_configs and data.get("configs"):
+                        extend_lines(data["configs"])
+
+                    # 写入URL行（按首次出现的顺序，去重在解析/合并时已完成）
+                    extend_lines(data["urls"])
+
     modified_m3u = '\n'.join(output_lines)
 
     # 安全写入
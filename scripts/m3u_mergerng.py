@@ -4,13 +4,28 @@ import os
 import sys
 import tempfile
 import shutil
+from functools import lru_cache
+from operator import itemgetter
 
 #频道组‘混乱’的m3u专用脚本，如将CCTV各频道按照体育、新闻、影视等分在了不同频道组
+
+# --- 模块级预编译正则（热循环中避免每次查 re 缓存） ---
+_GROUP_TITLE_RE = re.compile(r'group-title="([^"]*)"')
+_GROUP_TITLE_SUB_RE = re.compile(r'group-title="[^"]*"')
+_CCTV_NUM_RE = re.compile(r'CCTV-?(\d+)', re.IGNORECASE)
+
+# 删除横杠用的转换表，translate 一趟 C 扫描完成
+_NORM_TABLE = str.maketrans('', '', '-')
+
 # --- 1. 辅助函数：提取归一化 Key ---
+@lru_cache(maxsize=None)
 def get_norm_key(name):
-    """去掉横杠和后缀'台'，转大写，用于判断是否为同名频道"""
+    """去掉横杠和后缀'台'，转大写，用于判断是否为同名频道
+
+    同名频道的每个条目都会重复查 Key，做个缓存直接命中。
+    """
     if not name: return ""
-    temp = name.replace('-', '')
+    temp = name.translate(_NORM_TABLE)
     if temp.endswith('台'):
         temp = temp[:-1]
     return temp.strip().upper()
@@ -23,7 +38,7 @@ def is_preferred(name):
 # --- 3. 辅助函数：提取 CCTV 数字 ---
 def extract_cctv_num(name):
     """提取 CCTV 后的数字，用于排序。如果没有数字则排在最后。"""
-    match = re.search(r'(?i)CCTV-?(\d+)', name)
+    match = _CCTV_NUM_RE.search(name)
     return int(match.group(1)) if match else 999
 
 # --- 4. 辅助函数：解析 M3U (支持多URL) ---
@@ -35,112 +50,111 @@ def parse_m3u(file_path):
     order = []    # 记录第一次发现该频道的顺序
     header = "#EXTM3U"
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = [line.strip() for line in f.readlines()]
-        
     current_info = None
     current_name = None
     current_configs = []  # 存储配置行
     current_urls = []     # 存储当前频道的所有URL
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        
-        if line.startswith('#EXTM3U'):
-            header = line
-            i += 1
-            continue
-            
-        if line.startswith('#EXTINF:'):
-            # 如果之前有频道数据，先保存
-            if current_info and current_name:
-                norm_key = get_norm_key(current_name)
-                
-                # 提取原有的 group-title
-                group_match = re.search(r'group-title="([^"]*)"', current_info)
-                original_group = group_match.group(1) if group_match else "其他"
-                
-                if norm_key not in channels:
-                    channels[norm_key] = {
-                        "info": current_info,
-                        "name": current_name,
-                        "urls": set(current_urls),  # 存储所有URL
-                        "configs": list(current_configs),  # 存储配置行
-                        "original_group": original_group,
-                        "order_idx": len(order)
-                    }
-                    order.append(norm_key)
-                else:
-                    # 合并 URL
-                    channels[norm_key]["urls"].update(current_urls)
-                    # 合并配置行
-                    channels[norm_key]["configs"].extend(current_configs)
-                    # 检查显示名称优先级
-                    old_name = channels[norm_key]["name"]
-                    if is_preferred(current_name) and not is_preferred(old_name):
-                        channels[norm_key]["info"] = current_info
-                        channels[norm_key]["name"] = current_name
-            
-            # 开始新频道
-            current_info = line
-            name_match = re.search(r',([^,]+)$', line)
-            current_name = name_match.group(1).strip() if name_match else None
-            current_configs = []  # 重置配置行
-            current_urls = []     # 重置URL列表
-            i += 1
-            
-        elif line.startswith('#') and not line.startswith('#EXTINF:'):
-            # 收集配置行（如#EXTVLCOPT）
-            current_configs.append(line)
-            i += 1
-            
-        elif line.startswith(('http://', 'https://')) and current_name:
-            # 添加URL到当前频道
-            current_urls.append(line)
-            i += 1
-            
-        else:
-            # 未知行，跳过
-            i += 1
-    
+
+    # 逐行流式读取，避免先把整份文件物化成行列表
+    with open(file_path, 'r', encoding='utf-8', buffering=1 << 20) as f:
+        for raw_line in f:
+            line = raw_line.strip()
+
+            # 先按首字符分流，再做前缀细分，减少每行的 startswith 探测次数
+            if not line or line[0] != '#':
+                if current_name and line.startswith(('http://', 'https://')):
+                    # 添加URL到当前频道
+                    current_urls.append(line)
+                # 其余未知行跳过
+                continue
+
+            if line.startswith('#EXTM3U'):
+                header = line
+
+            elif line.startswith('#EXTINF:'):
+                # 如果之前有频道数据，先保存
+                if current_info and current_name:
+                    norm_key = get_norm_key(current_name)
+
+                    # 提取原有的 group-title
+                    group_match = _GROUP_TITLE_RE.search(current_info)
+                    original_group = group_match.group(1) if group_match else "其他"
+
+                    entry = channels.get(norm_key)  # 只做一次哈希查找
+                    if entry is None:
+                        channels[norm_key] = {
+                            "info": current_info,
+                            "name": current_name,
+                            # dict 当有序集合用：去重且保留首次出现的顺序
+                            "urls": dict.fromkeys(current_urls),
+                            "configs": list(current_configs),  # 存储配置行
+                            "original_group": original_group,
+                            "order_idx": len(order)
+                        }
+                        order.append(norm_key)
+                    else:
+                        # 合并 URL
+                        entry["urls"].update(dict.fromkeys(current_urls))
+                        # 合并配置行
+                        entry["configs"].extend(current_configs)
+                        # 检查显示名称优先级
+                        old_name = entry["name"]
+                        if is_preferred(current_name) and not is_preferred(old_name):
+                            entry["info"] = current_info
+                            entry["name"] = current_name
+
+                # 开始新频道
+                current_info = line
+                # 频道名就是最后一个逗号之后的部分，rpartition 比正则快得多
+                _, sep, name_tail = line.rpartition(',')
+                current_name = name_tail.strip() if sep else None
+                current_configs = []  # 重置配置行
+                current_urls = []     # 重置URL列表
+
+            else:
+                # 收集配置行（如#EXTVLCOPT）
+                current_configs.append(line)
+
+
     # 处理最后一个频道
     if current_info and current_name:
         norm_key = get_norm_key(current_name)
         
-        group_match = re.search(r'group-title="([^"]*)"', current_info)
+        group_match = _GROUP_TITLE_RE.search(current_info)
         original_group = group_match.group(1) if group_match else "其他"
         
-        if norm_key not in channels:
+        entry = channels.get(norm_key)
+        if entry is None:
             channels[norm_key] = {
                 "info": current_info,
                 "name": current_name,
-                "urls": set(current_urls),
+                "urls": dict.fromkeys(current_urls),
                 "configs": list(current_configs),
                 "original_group": original_group,
                 "order_idx": len(order)
             }
             order.append(norm_key)
         else:
-            channels[norm_key]["urls"].update(current_urls)
-            channels[norm_key]["configs"].extend(current_configs)
-            old_name = channels[norm_key]["name"]
+            entry["urls"].update(dict.fromkeys(current_urls))
+            entry["configs"].extend(current_configs)
+            old_name = entry["name"]
             if is_preferred(current_name) and not is_preferred(old_name):
-                channels[norm_key]["info"] = current_info
-                channels[norm_key]["name"] = current_name
+                entry["info"] = current_info
+                entry["name"] = current_name
                     
     return header, channels, order
 
 # --- 5. 安全文件写入函数 ---
-def safe_write_output(header, final_list, input_path, output_path, no_config=False):
+def safe_write_output(header, final_list, input_path, output_path, no_config=False, keep_order=False):
     """
     安全地写入输出文件，支持同文件覆盖
-    
+
     :param header: M3U文件头部
     :param final_list: 最终频道列表
     :param input_path: 输入文件路径
     :param output_path: 输出文件路径
     :param no_config: 是否过滤配置行
+    :param keep_order: URL保持首次出现顺序（不按字母排序）
     :return: (success, temp_path) 成功返回(True, None)，失败返回(False, temp_path)
     """
     # 获取绝对路径以判断是否为同一个文件
@@ -168,28 +182,35 @@ def safe_write_output(header, final_list, input_path, output_path, no_config=Fal
             # 直接打开输出文件
             out_f = open(output_path, 'w', encoding='utf-8')
         
-        # 写入数据
-        with out_f:
-            out_f.write(header + '\n')
-            for item in final_list:
-                # 替换或更新 info 行中的 group-title
-                info = item["info"]
-                new_group = item["final_group"]
-                if 'group-title="' in info:
-                    info = re.sub(r'group-title="[^"]*"', f'group-title="{new_group}"', info)
+        # 先在内存中拼好所有行，最后一次性写出，避免逐行小块写入
+        out_lines = [header]
+        for item in final_list:
+            # 替换或更新 info 行中的 group-title
+            info = item["info"]
+            new_group = item["final_group"]
+            if 'group-title="' in info:
+                info = _GROUP_TITLE_SUB_RE.sub(f'group-title="{new_group}"', info)
+            else:
+                # 把 group-title 追加到属性段末尾、频道名之前；
+                # 旧的全串 replace 会把属性插到时长前面，生成错位的 EXTINF
+                head, sep, name_tail = info.rpartition(',')
+                if sep:
+                    info = f'{head} group-title="{new_group}",{name_tail}'
                 else:
-                    info = info.replace('#EXTINF:', f'#EXTINF: group-title="{new_group}",')
-                
-                out_f.write(info + '\n')
-                
-                # 写入配置行（如果不过滤）
-                if not no_config and item.get("configs"):
-                    for config_line in item["configs"]:
-                        out_f.write(config_line + '\n')
-                
-                # 写入 URL 行 (排序后，保持稳定)
-                for url in sorted(list(item["urls"])):
-                    out_f.write(url + '\n')
+                    info = f'{info} group-title="{new_group}",'
+
+            out_lines.append(info)
+
+            # 写入配置行（如果不过滤）
+            if not no_config and item.get("configs"):
+                out_lines.extend(item["configs"])
+
+            # 写入 URL 行（默认排序一次保证稳定；--keep-order 时保留原顺序）
+            out_lines.extend(item["urls"] if keep_order else sorted(item["urls"]))
+
+        with out_f:
+            out_f.write('\n'.join(out_lines))
+            out_f.write('\n')
         
         # 如果是同一个文件，进行原子替换
         if is_same_file:
@@ -335,8 +356,11 @@ def main():
         if data.get("configs"):
             stats['has_config_channels'] += 1
         
-        if "CCTV" in name.upper():
+        # key 即 get_norm_key 的结果，已是大写，省一次逐频道的 upper()
+        if "CCTV" in key:
             data["final_group"] = "央视"
+            # 排序键只算一次，sort 时用 C 实现的 itemgetter 取出
+            data["_cctv_num"] = extract_cctv_num(name)
             cctv_bucket.append(data)
             stats['cctv_channels'] += 1
         elif "卫视" in name:
@@ -350,7 +374,7 @@ def main():
 
     # 排序：
     # 央视：按数字排
-    cctv_bucket.sort(key=lambda x: extract_cctv_num(x["name"]))
+    cctv_bucket.sort(key=itemgetter("_cctv_num"))
     # 卫视：按原顺序排
     weishee_bucket.sort(key=lambda x: x["order_idx"])
     # 其他：按原频道组名，组内按原顺序
@@ -360,7 +384,8 @@ def main():
     final_list = cctv_bucket + weishee_bucket + other_bucket
 
     # 安全写入输出文件
-    success, temp_path = safe_write_output(header, final_list, args.input, args.output, args.no_config)
+    success, temp_path = safe_write_output(header, final_list, args.input, args.output,
+                                           args.no_config, args.keep_order)
     
     # 如果失败，清理临时文件
     if not success:
@@ -5,12 +5,26 @@ import os
 import tempfile
 import shutil
 import traceback
-from typing import List, Dict, Optional, Tuple, Set
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple, Set
+
+# ==================== 模块级预编译正则 ====================
+# 每个EXTINF行都要匹配这些模式，预编译后省掉 re 缓存查找
+_RE_TVG_DQ = re.compile(r'tvg-name="[^"]*"')
+_RE_TVG_SQ = re.compile(r"tvg-name='[^']*'")
 
 # ==================== 调试和错误处理配置 ====================
 DEBUG_MODE = os.environ.get('DEBUG', 'false').lower() == 'true'
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info').lower()
 
+# 热路径上的 debug 日志先查这个布尔开关：关着时连 f-string 参数都不用构造
+_DEBUG = DEBUG_MODE and LOG_LEVEL in ('debug', 'trace')
+
+def _refresh_debug_flag():
+    """--debug/--verbose 改写全局配置后重算热路径开关"""
+    global _DEBUG
+    _DEBUG = DEBUG_MODE and LOG_LEVEL in ('debug', 'trace')
+
 def debug_log(message: str, level: str = 'debug'):
     """分级日志输出"""
     if DEBUG_MODE or level in ['error', 'warn', 'info']:
@@ -75,150 +89,183 @@ def validate_arguments_extended(args) -> Tuple[bool, str]:
 # ==================== 原有函数（添加调试输出） ====================
 def parse_extinf_group(extinf_line: str) -> Optional[str]:
     """从EXTINF行解析group-title属性"""
-    debug_log(f"解析EXTINF行: {extinf_line[:100]}...", 'debug')
-    
-    # 查找 group-title="..." 模式
-    group_match = re.search(r'group-title="([^"]*)"', extinf_line)
-    if group_match:
-        result = group_match.group(1)
-        debug_log(f"从group-title属性解析到组名: {result}", 'debug')
-        return result
-    
-    # 也可以尝试查找 group-title='...' 单引号模式
-    group_match = re.search(r"group-title='([^']*)'", extinf_line)
-    if group_match:
-        result = group_match.group(1)
-        debug_log(f"从group-title属性(单引号)解析到组名: {result}", 'debug')
-        return result
-    
-    debug_log("EXTINF行中没有找到group-title属性", 'debug')
+    if _DEBUG:
+        debug_log(f"解析EXTINF行: {extinf_line[:100]}...", 'debug')
+    
+    # 手工扫描代替正则：定位 group-title= 后直接取引号内的值
+    i = extinf_line.find('group-title=')
+    if i >= 0 and i + 12 < len(extinf_line):
+        quote = extinf_line[i + 12]  # 12 == len('group-title=')
+        if quote in ('"', "'"):
+            j = extinf_line.find(quote, i + 13)
+            if j >= 0:
+                result = extinf_line[i + 13:j]
+                if _DEBUG:
+                    debug_log(f"从group-title属性解析到组名: {result}", 'debug')
+                return result
+
+    if _DEBUG:
+        debug_log("EXTINF行中没有找到group-title属性", 'debug')
     return None
 
 def update_extinf_group(extinf_line: str, new_group_name: str) -> str:
     """更新EXTINF行中的group-title属性"""
-    debug_log(f"更新组名: '{extinf_line[:50]}...' -> '{new_group_name}'", 'debug')
-    
-    # 如果已有group-title属性，替换它
-    if 'group-title="' in extinf_line:
-        updated_line = re.sub(r'group-title="[^"]*"', f'group-title="{new_group_name}"', extinf_line)
-    elif "group-title='" in extinf_line:
-        updated_line = re.sub(r"group-title='[^']*'", f"group-title='{new_group_name}'", extinf_line)
+    if _DEBUG:
+        debug_log(f"更新组名: '{extinf_line[:50]}...' -> '{new_group_name}'", 'debug')
+    
+    # 如果已有group-title属性，手工定位引号范围后用切片拼出新行
+    i = extinf_line.find('group-title=')
+    quote = extinf_line[i + 12] if 0 <= i and i + 12 < len(extinf_line) else ''
+    if quote in ('"', "'"):
+        j = extinf_line.find(quote, i + 13)
+        if j >= 0:
+            updated_line = f'{extinf_line[:i + 13]}{new_group_name}{extinf_line[j:]}'
+        else:
+            # 引号未闭合，保持原样（与旧正则替换失配时的行为一致）
+            updated_line = extinf_line
     else:
-        # 如果没有group-title属性，需要添加
-        if ',' in extinf_line:
-            parts = extinf_line.rsplit(',', 1)
-            attributes = parts[0]
-            channel_name = parts[1]
-            if attributes.endswith('"'):
-                updated_line = f'{attributes} group-title="{new_group_name}",{channel_name}'
-            else:
-                updated_line = f'{attributes} group-title="{new_group_name}",{channel_name}'
+        # 如果没有group-title属性，在最后一个逗号前插入；rfind 一次定位，
+        # 切片拼接代替 rsplit 产生的中间列表
+        k = extinf_line.rfind(',')
+        if k >= 0:
+            updated_line = f'{extinf_line[:k]} group-title="{new_group_name}",{extinf_line[k + 1:]}'
         else:
             debug_log(f"无法更新组名，EXTINF格式异常: {extinf_line}", 'warn')
             return extinf_line
     
-    debug_log(f"更新后的行: {updated_line[:100]}...", 'debug')
+    if _DEBUG:
+        debug_log(f"更新后的行: {updated_line[:100]}...", 'debug')
     return updated_line
 
-def parse_m3u_file(lines: List[str]) -> Tuple[List[Dict], List[str]]:
-    """解析M3U文件，支持多种格式"""
-    debug_log(f"开始解析M3U文件，共 {len(lines)} 行", 'info')
-    
+class Channel:
+    """单个频道的解析结果
+
+    用 __slots__ 取代逐频道 dict，省掉每实例的哈希表开销，
+    属性访问也比字符串键查找更快。
+    """
+    __slots__ = ('inf', 'urls', 'group', 'extgrp_line', 'inf_group', 'group_id')
+
+    def __init__(self, inf: str, urls: List[str],
+                 group: Optional[str], extgrp_line: Optional[str],
+                 inf_group: Optional[str], group_id: int):
+        self.inf = inf
+        self.urls = urls
+        self.group = group
+        self.extgrp_line = extgrp_line
+        # EXTINF行自带的group-title值；解析时已算出，后续不再重复解析
+        self.inf_group = inf_group
+        # 组名的整数编号：去重集合用整数哈希，免去反复哈希长组名字符串
+        self.group_id = group_id
+
+@dataclass
+class SortStats:
+    """一次处理的统计结果，随输出生成器被消费而累积"""
+    rename_count: int = 0
+    sort_count: int = 0
+    total_channels: int = 0
+    group_rename_count: int = 0
+    group_sort_count: int = 0
+    group_rename_with_k_count: int = 0
+    lines_written: int = 0
+
+def parse_m3u_file(lines: Iterable[str]) -> Tuple[List['Channel'], List[str]]:
+    """解析M3U文件，支持多种格式
+
+    lines 可以是已打开的文件对象或任意行序列，单趟逐行消费，
+    不再预先物化/预清洗整份行列表。
+    """
+    debug_log("开始解析M3U文件", 'info')
+
     channels_data = []
     header_lines = []
-    
+    group_ids: Dict[Optional[str], int] = {}
+
     current_inf = None
     current_urls = []
     current_group = None
     current_extgrp = None
-    channel_count = 0
+    current_inf_group = None
     line_num = 0
-    
-    i = 0
-    while i < len(lines):
+
+    for raw_line in lines:
         line_num += 1
-        line = lines[i].strip()
-        
+        line = raw_line.strip()
+
         if not line:
-            i += 1
             continue
-        
-        debug_log(f"行 {line_num}: 处理 '{line[:50]}...'", 'debug')
-        
+
+        if _DEBUG:
+            debug_log(f"行 {line_num}: 处理 '{line[:50]}...'", 'debug')
+
+        # 先按首字符分流：非 '#' 行一律是URL，跳过所有标签前缀探测
+        if line[0] != '#':
+            current_urls.append(line)
+            if _DEBUG:
+                debug_log(f"行 {line_num}: 识别为URL ({len(current_urls)})", 'debug')
+            continue
+
         # 处理文件头
-        if i == 0 and (line.startswith('#EXTM3U') or line.startswith('#PLAYLIST')):
+        if line_num == 1 and (line.startswith('#EXTM3U') or line.startswith('#PLAYLIST')):
             header_lines.append(line)
-            debug_log(f"行 {line_num}: 识别为文件头", 'debug')
-            i += 1
+            if _DEBUG:
+                debug_log(f"行 {line_num}: 识别为文件头", 'debug')
             continue
-        
+
         # 处理其他可能的头部注释
-        if i < 3 and line.startswith('#'):
+        if line_num <= 3 and line.startswith('#'):
             if not line.startswith('#EXTINF') and not line.startswith('#EXTGRP'):
                 header_lines.append(line)
-                debug_log(f"行 {line_num}: 识别为头部注释", 'debug')
-                i += 1
+                if _DEBUG:
+                    debug_log(f"行 {line_num}: 识别为头部注释", 'debug')
                 continue
-        
+
         # 处理EXTGRP标签
         if line.startswith('#EXTGRP:'):
             current_extgrp = line
             current_group = line.replace('#EXTGRP:', '').strip()
-            debug_log(f"行 {line_num}: 识别为EXTGRP标签，组名: {current_group}", 'debug')
-            i += 1
+            if _DEBUG:
+                debug_log(f"行 {line_num}: 识别为EXTGRP标签，组名: {current_group}", 'debug')
             continue
-        
+
         # 处理EXTINF行
         if line.startswith('#EXTINF'):
             # 保存上一个频道
             if current_inf:
                 group = current_group
                 if group is None:
-                    group = parse_extinf_group(current_inf)
-                
-                channels_data.append({
-                    "inf": current_inf, 
-                    "urls": current_urls,
-                    "group": group,
-                    "extgrp_line": current_extgrp
-                })
-                channel_count += 1
-                debug_log(f"完成解析频道 {channel_count}: 组名='{group}', URL数量={len(current_urls)}", 'debug')
-            
+                    group = current_inf_group
+
+                channels_data.append(Channel(current_inf, current_urls, group,
+                                             current_extgrp, current_inf_group,
+                                             group_ids.setdefault(group, len(group_ids))))
+                if _DEBUG:
+                    debug_log(f"完成解析频道 {len(channels_data)}: 组名='{group}', URL数量={len(current_urls)}", 'debug')
+
             # 开始新频道
             current_inf = line
             current_urls = []
-            current_group = parse_extinf_group(line)
+            current_inf_group = parse_extinf_group(line)
+            current_group = current_inf_group
             current_extgrp = None
-            debug_log(f"行 {line_num}: 识别为新频道开始", 'debug')
-            i += 1
-            continue
-        
-        # 处理URL行
-        if not line.startswith('#'):
-            current_urls.append(line)
-            debug_log(f"行 {line_num}: 识别为URL ({len(current_urls)})", 'debug')
-            i += 1
+            if _DEBUG:
+                debug_log(f"行 {line_num}: 识别为新频道开始", 'debug')
             continue
-        
+
         # 其他注释行
-        debug_log(f"行 {line_num}: 跳过注释行", 'debug')
-        i += 1
-    
+        if _DEBUG:
+            debug_log(f"行 {line_num}: 跳过注释行", 'debug')
+
     # 保存最后一个频道
     if current_inf:
         group = current_group
         if group is None:
-            group = parse_extinf_group(current_inf)
-        
-        channels_data.append({
-            "inf": current_inf, 
-            "urls": current_urls,
-            "group": group,
-            "extgrp_line": current_extgrp
-        })
-        channel_count += 1
-        debug_log(f"完成解析最后一个频道: 组名='{group}', URL数量={len(current_urls)}", 'debug')
+            group = current_inf_group
+
+        channels_data.append(Channel(current_inf, current_urls, group,
+                                     current_extgrp, current_inf_group,
+                                     group_ids.setdefault(group, len(group_ids))))
+        if _DEBUG:
+            debug_log(f"完成解析最后一个频道: 组名='{group}', URL数量={len(current_urls)}", 'debug')
     
     debug_log(f"解析完成: 共 {len(channels_data)} 个频道, {len(header_lines)} 行头部", 'info')
     
@@ -226,7 +273,7 @@ def parse_m3u_file(lines: List[str]) -> Tuple[List[Dict], List[str]]:
     if DEBUG_MODE:
         group_stats = {}
         for ch in channels_data:
-            group = ch.get("group", "无组名")
+            group = ch.group
             group_stats[group] = group_stats.get(group, 0) + 1
         
         debug_log("频道组统计:", 'debug')
@@ -239,8 +286,13 @@ def sort_m3u_urls(input_file: str, output_file: str, keywords_str: str,
                   reverse_mode: bool = False, target_channels_str: Optional[str] = None,
                   new_name: Optional[str] = None, force: bool = False,
                   group_names_str: Optional[str] = None, rename_group: Optional[str] = None,
-                  group_sort: bool = False) -> Tuple[List[str], int, int, int, int, int, int]:
-    """处理M3U文件，支持URL排序和条件重命名"""
+                  group_sort: bool = False) -> Tuple[Optional[Iterator[str]], SortStats]:
+    """处理M3U文件，支持URL排序和条件重命名
+
+    解析仍然一次完成，但输出改为生成器逐行产出，由调用方边消费边写盘，
+    不再物化整份输出行列表。返回 (行生成器, 统计对象)；读取/解析失败时
+    生成器为 None。统计字段在生成器被完全消费后才是最终值。
+    """
     
     debug_log("=" * 60, 'info')
     debug_log("开始处理M3U文件", 'info')
@@ -260,7 +312,38 @@ def sort_m3u_urls(input_file: str, output_file: str, keywords_str: str,
     keywords = [k.strip() for k in keywords_str.split(',') if k.strip()]
     target_channels = [c.strip() for c in target_channels_str.split(',') if c.strip()] if target_channels_str else None
     group_names = [g.strip() for g in group_names_str.split(',') if g.strip()] if group_names_str else None
-    
+
+    # 匹配条件的小写形式只在此处计算一次，热循环里不再反复 lower()
+    keywords_lc = tuple(k.lower() for k in keywords)
+    target_channels_lc = tuple(c.lower() for c in target_channels) if target_channels else ()
+    group_names_lc = tuple(g.lower() for g in group_names) if group_names else ()
+
+    # 多关键字匹配：把整张关键字表编成一条交替正则（多模式匹配，类似
+    # Aho–Corasick 自动机的思路），每个字符串只扫一遍，前瞻捕获保证
+    # 同一位置命中多个关键字时取列表序最靠前的那个
+    def _build_matcher(needles):
+        if not needles:
+            return None, None
+        rank = {}
+        for i, n in enumerate(needles):
+            rank.setdefault(n, i)
+        pattern = re.compile('(?=(' + '|'.join(re.escape(n) for n in needles) + '))')
+        return pattern, rank
+
+    kw_matcher, kw_rank = _build_matcher(keywords_lc)
+    group_matcher, group_rank = _build_matcher(group_names_lc)
+
+    def _min_rank(matcher, rank, haystack_lc):
+        """返回 haystack 中命中的最小关键字序号，未命中返回 None"""
+        best = None
+        for m in matcher.finditer(haystack_lc):
+            r = rank[m.group(1)]
+            if best is None or r < best:
+                best = r
+                if best == 0:
+                    break
+        return best
+
     debug_log(f"解析后的关键字列表: {keywords}", 'debug')
     debug_log(f"解析后的目标频道列表: {target_channels}", 'debug')
     debug_log(f"解析后的目标组列表: {group_names}", 'debug')
@@ -269,48 +352,42 @@ def sort_m3u_urls(input_file: str, output_file: str, keywords_str: str,
     rename_mode = bool(new_name or rename_group)
     debug_log(f"重命名模式: {rename_mode}", 'info')
     
+    # 2. 读取+结构化解析：把文件迭代器直接交给解析器，单趟完成，
+    # 省去 readlines 的整表物化和随后的预清洗列表
     try:
         debug_log(f"正在读取文件: {input_file}", 'info')
-        with open(input_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        debug_log(f"读取成功，共 {len(lines)} 行", 'info')
-    except Exception as e:
-        log_exception(e, "读取输入文件")
-        return None, 0, 0, 0, 0, 0, 0
-    
-    # 2. 结构化解析
-    try:
-        channels_data, header_lines = parse_m3u_file([line.rstrip('\n') for line in lines])
+        with open(input_file, 'r', encoding='utf-8', buffering=1 << 20) as f:
+            channels_data, header_lines = parse_m3u_file(f)
         debug_log(f"解析出 {len(channels_data)} 个频道", 'info')
     except Exception as e:
-        log_exception(e, "解析M3U文件")
-        return None, 0, 0, 0, 0, 0, 0
+        log_exception(e, "读取/解析M3U文件")
+        return None, SortStats()
     
-    # 排序得分函数
-    def get_url_sort_score(item: str) -> int:
-        if "://" not in item: 
+    # 排序得分函数；item_lc 为调用方缓存好的小写形式，避免重复 lower()
+    def get_url_sort_score(item: str, item_lc: Optional[str] = None) -> int:
+        if "://" not in item:
             return 9999
-        
-        for index, kw in enumerate(keywords):
-            if kw.lower() in item.lower():
+
+        if kw_matcher is not None:
+            index = _min_rank(kw_matcher, kw_rank, item_lc if item_lc is not None else item.lower())
+            if index is not None:
                 score = (index + 1) if reverse_mode else (index - len(keywords))
-                debug_log(f"URL '{item[:50]}...' 匹配关键字 '{kw}'，得分: {score}", 'debug')
+                if _DEBUG:
+                    debug_log(f"URL '{item[:50]}...' 匹配关键字 '{keywords[index]}'，得分: {score}", 'debug')
                 return score
         return 0
 
     # 频道组排序得分函数 - 修复版本，支持反向模式
-    def get_group_sort_score(channel_data: Dict, reverse: bool = False) -> int:
-        ch_group = channel_data.get("group", "")
-        
-        if group_names:
-            for index, group_kw in enumerate(group_names):
-                if group_kw.lower() in ch_group.lower():
-                    if reverse:
-                        # 反向模式：匹配的组得高分，排后面
-                        return index + 1000
-                    else:
-                        # 正常模式：匹配的组得低分，排前面
-                        return index - len(group_names)
+    def get_group_sort_score(channel_data: Channel, reverse: bool = False) -> int:
+        if group_matcher is not None:
+            index = _min_rank(group_matcher, group_rank, (channel_data.group or "").lower())
+            if index is not None:
+                if reverse:
+                    # 反向模式：匹配的组得高分，排后面
+                    return index + 1000
+                else:
+                    # 正常模式：匹配的组得低分，排前面
+                    return index - len(group_names)
         
         # 不匹配的组
         if reverse:
@@ -320,199 +397,200 @@ def sort_m3u_urls(input_file: str, output_file: str, keywords_str: str,
 
     # 重命名频道函数
     def rename_inf(inf_line: str, name: str) -> str:
-        debug_log(f"重命名频道: '{inf_line[:50]}...' -> '{name}'", 'debug')
+        if _DEBUG:
+            debug_log(f"重命名频道: '{inf_line[:50]}...' -> '{name}'", 'debug')
         
+        # tvg-name 每行只会出现一次，count=1 让引擎替换完就停
         if 'tvg-name="' in inf_line:
-            inf_line = re.sub(r'tvg-name="[^"]*"', f'tvg-name="{name}"', inf_line)
+            inf_line = _RE_TVG_DQ.sub(f'tvg-name="{name}"', inf_line, count=1)
         elif "tvg-name='" in inf_line:
-            inf_line = re.sub(r"tvg-name='[^']*'", f"tvg-name='{name}'", inf_line)
+            inf_line = _RE_TVG_SQ.sub(f"tvg-name='{name}'", inf_line, count=1)
         
         if ',' in inf_line:
             parts = inf_line.rsplit(',', 1)
             return f"{parts[0]},{name}"
         return f"{inf_line},{name}"
 
-    # 3. 生成输出内容
-    output_lines = []
-    rename_count = 0
-    sort_count = 0
-    group_rename_count = 0
-    group_sort_count = 0
-    group_rename_with_k_count = 0
-    
-    # 添加文件头
-    output_lines.extend(header_lines)
-    debug_log(f"添加了 {len(header_lines)} 行头部信息", 'debug')
-    
+    # 3. 生成输出内容（惰性逐行产出）
+    stats = SortStats(total_channels=len(channels_data))
+
     # 如果需要组间排序 - 修复版，支持反向模式
     if group_sort and group_names and not rename_mode:
         debug_log(f"执行组间排序，反向模式: {reverse_mode}", 'info')
         
         # 使用改进的组排序函数，支持反向模式
         channels_data.sort(key=lambda ch: get_group_sort_score(ch, reverse_mode))
-        group_sort_count = 1
+        stats.group_sort_count = 1
         
         # 调试输出排序结果
         if DEBUG_MODE:
             debug_log("组排序后的频道顺序:", 'debug')
             for idx, ch in enumerate(channels_data[:10]):  # 只显示前10个
-                group = ch.get("group", "无组名")
+                group = ch.group
                 debug_log(f"  频道 {idx+1}: 组='{group}', 得分={get_group_sort_score(ch, reverse_mode)}", 'debug')
     
-    # 处理每个频道
-    processed_groups = set()
-    last_group = None
-    processed_channel_count = 0
-    
-    debug_log(f"开始处理 {len(channels_data)} 个频道", 'info')
-    
-    for idx, ch in enumerate(channels_data):
-        processed_channel_count += 1
-        ch_group = ch.get("group", "")
-        extgrp_line = ch.get("extgrp_line")
-        
-        debug_log(f"处理频道 {idx+1}/{len(channels_data)}: 组='{ch_group}'", 'debug')
-        
-        # 条件匹配
-        name_match = any(tc.lower() in ch["inf"].lower() for tc in target_channels) if target_channels else False
-        url_match_for_rename = any(any(kw.lower() in url.lower() for kw in keywords) for url in ch["urls"])
-        group_match = any(gn.lower() in ch_group.lower() for gn in group_names) if group_names else True
-        
-        debug_log(f"  频道名匹配: {name_match}, URL匹配: {url_match_for_rename}, 组匹配: {group_match}", 'debug')
-        
-        # 判断是否需要处理当前频道
-        should_process = True
-        if group_names and not group_match:
-            should_process = not group_sort or (group_sort and not rename_mode)
+    def _emit() -> Iterator[str]:
+        """逐行产出最终内容，同时把计数累积到 stats 上"""
+        # 文件头
+        yield from header_lines
+        debug_log(f"添加了 {len(header_lines)} 行头部信息", 'debug')
+
+        # 处理每个频道；已计数的组按整数编号去重
+        processed_groups: Set[int] = set()
+        last_group = None
+
+        debug_log(f"开始处理 {len(channels_data)} 个频道", 'info')
+
+        for idx, ch in enumerate(channels_data):
+            ch_group = ch.group or ""
+            extgrp_line = ch.extgrp_line
         
-        # 输出EXTGRP行
-        if ch_group and ch_group != last_group:
-            debug_log(f"  组变化: '{last_group}' -> '{ch_group}'", 'debug')
-            
-            if rename_mode and rename_group and group_match:
-                should_rename_this_group = False
-                
-                if not keywords and not target_channels:
-                    should_rename_this_group = True
-                elif keywords and not target_channels and url_match_for_rename:
-                    should_rename_this_group = True
-                elif not keywords and target_channels and name_match:
-                    should_rename_this_group = True
-                elif keywords and target_channels and name_match and url_match_for_rename:
-                    should_rename_this_group = True
-                
-                if should_rename_this_group:
-                    output_lines.append(f"#EXTGRP:{rename_group}")
-                    if ch_group not in processed_groups:
-                        group_rename_count += 1
-                        processed_groups.add(ch_group)
-                        if keywords:
-                            group_rename_with_k_count += 1
+            if _DEBUG:
+                debug_log(f"处理频道 {idx+1}/{len(channels_data)}: 组='{ch_group}'", 'debug')
+
+            # 条件匹配：每个待查字符串只 lower() 一次，且没有对应条件时干脆不做
+            inf_lc = ch.inf.lower() if target_channels else None
+            name_match = inf_lc is not None and any(tc in inf_lc for tc in target_channels_lc)
+            # URL的小写形式按频道缓存一份，条件匹配和排序打分共用
+            urls_lc = [u.lower() for u in ch.urls] if kw_matcher is not None else None
+            url_match_for_rename = urls_lc is not None and any(map(kw_matcher.search, urls_lc))
+            group_match = bool(group_matcher.search(ch_group.lower())) if group_matcher else True
+
+            if _DEBUG:
+                debug_log(f"  频道名匹配: {name_match}, URL匹配: {url_match_for_rename}, 组匹配: {group_match}", 'debug')
+
+            # 组重命名条件只按给定的过滤条件判定一次：
+            # 给了关键字就要求URL命中，给了目标频道就要求频道名命中
+            group_rename_match = ((not keywords or url_match_for_rename)
+                                  and (not target_channels or name_match))
+
+            # 判断是否需要处理当前频道
+            should_process = True
+            if group_names and not group_match:
+                should_process = not group_sort or (group_sort and not rename_mode)
+
+            # 输出EXTGRP行
+            if ch_group and ch_group != last_group:
+                if _DEBUG:
+                    debug_log(f"  组变化: '{last_group}' -> '{ch_group}'", 'debug')
+
+                if rename_mode and rename_group and group_match:
+                    if group_rename_match:
+                        yield f"#EXTGRP:{rename_group}"
+                        if ch.group_id not in processed_groups:
+                            stats.group_rename_count += 1
+                            processed_groups.add(ch.group_id)
+                            if keywords:
+                                stats.group_rename_with_k_count += 1
+                        last_group = ch_group
+                        if _DEBUG:
+                            debug_log(f"  重命名EXTGRP行: '{ch_group}' -> '{rename_group}'", 'debug')
+                    else:
+                        if extgrp_line:
+                            yield extgrp_line
+                        last_group = ch_group
+                elif not rename_mode:
+                    if extgrp_line:
+                        yield extgrp_line
                     last_group = ch_group
-                    debug_log(f"  重命名EXTGRP行: '{ch_group}' -> '{rename_group}'", 'debug')
                 else:
                     if extgrp_line:
-                        output_lines.append(extgrp_line)
+                        yield extgrp_line
                     last_group = ch_group
-            elif not rename_mode:
-                if extgrp_line:
-                    output_lines.append(extgrp_line)
-                last_group = ch_group
-            else:
-                if extgrp_line:
-                    output_lines.append(extgrp_line)
-                last_group = ch_group
-        
-        if not should_process:
-            debug_log(f"  跳过处理（不匹配组条件）", 'debug')
-            output_lines.append(ch["inf"])
-            output_lines.extend(ch["urls"])
-            continue
-        
-        # 初始化最终INF行
-        final_inf = ch["inf"]
-        channel_renamed = False
-        
-        # 重命名模式逻辑
-        if rename_mode:
-            debug_log("  执行重命名模式逻辑", 'debug')
-            
-            # 频道重命名
-            if new_name and target_channels and keywords:
-                if name_match and url_match_for_rename:
-                    final_inf = rename_inf(ch["inf"], new_name)
-                    rename_count += 1
-                    channel_renamed = True
-                    debug_log(f"  频道重命名成功，计数: {rename_count}", 'debug')
-            
-            # 频道组重命名（group-title属性）
-            if rename_group and group_match and parse_extinf_group(final_inf):
-                should_rename_group_attr = False
-                
-                if not keywords and not target_channels:
-                    should_rename_group_attr = True
-                elif keywords and not target_channels and url_match_for_rename:
-                    should_rename_group_attr = True
-                elif not keywords and target_channels and name_match:
-                    should_rename_group_attr = True
-                elif keywords and target_channels and name_match and url_match_for_rename:
-                    should_rename_group_attr = True
-                
-                if should_rename_group_attr:
-                    final_inf = update_extinf_group(final_inf, rename_group)
-                    if ch_group not in processed_groups:
-                        group_rename_count += 1
-                        processed_groups.add(ch_group)
-                        if keywords:
-                            group_rename_with_k_count += 1
-                    debug_log(f"  组属性重命名成功，计数: {group_rename_count}", 'debug')
-            
-            # 重命名模式下：先输出EXTINF行，再输出URLs
-            output_lines.append(final_inf)
-            output_lines.extend(ch["urls"])
-            
-        # 排序模式逻辑
-        else:
-            debug_log("  执行排序模式逻辑", 'debug')
-            should_sort_urls = False
-            
-            if group_sort:
-                should_sort_urls = group_match and len(ch["urls"]) > 1
+
+            # 各分支只改写 final_inf/final_urls，循环末尾统一产出一次
+            final_inf = ch.inf
+            final_urls = ch.urls
+            channel_renamed = False
+
+            if not should_process:
+                if _DEBUG:
+                    debug_log(f"  跳过处理（不匹配组条件）", 'debug')
+
+            # 重命名模式逻辑
+            elif rename_mode:
+                if _DEBUG:
+                    debug_log("  执行重命名模式逻辑", 'debug')
+
+                # 频道重命名
+                if new_name and target_channels and keywords:
+                    if name_match and url_match_for_rename:
+                        final_inf = rename_inf(ch.inf, new_name)
+                        stats.rename_count += 1
+                        channel_renamed = True
+                        if _DEBUG:
+                            debug_log(f"  频道重命名成功，计数: {stats.rename_count}", 'debug')
+
+                # 频道组重命名（group-title属性）
+                # inf_group 是解析时缓存的group-title值；重命名只动tvg-name/频道名，
+                # 不影响group-title是否存在，无需再解析一次
+                if rename_group and group_match and ch.inf_group:
+                    if group_rename_match:
+                        final_inf = update_extinf_group(final_inf, rename_group)
+                        if ch.group_id not in processed_groups:
+                            stats.group_rename_count += 1
+                            processed_groups.add(ch.group_id)
+                            if keywords:
+                                stats.group_rename_with_k_count += 1
+                        if _DEBUG:
+                            debug_log(f"  组属性重命名成功，计数: {stats.group_rename_count}", 'debug')
+
+            # 排序模式逻辑
             else:
-                if target_channels:
-                    should_sort_urls = name_match and group_match
-                elif group_names:
-                    should_sort_urls = group_match
+                if _DEBUG:
+                    debug_log("  执行排序模式逻辑", 'debug')
+                should_sort_urls = False
+
+                if group_sort:
+                    should_sort_urls = group_match and len(ch.urls) > 1
                 else:
-                    should_sort_urls = True
-            
-            # 排序模式下：先输出EXTINF行
-            output_lines.append(final_inf)
-            
-            # 然后输出URLs（可能排序）
-            if should_sort_urls and len(ch["urls"]) > 1:
-                sorted_list = sorted(ch["urls"], key=get_url_sort_score)
-                output_lines.extend(sorted_list)
-                if sorted_list != ch["urls"]:
-                    sort_count += 1
-                    debug_log(f"  URL排序成功，排序变化计数: {sort_count}", 'debug')
-            else:
-                output_lines.extend(ch["urls"])
-    
-    debug_log(f"处理完成: 重命名 {rename_count} 个频道, 排序 {sort_count} 个频道", 'info')
-    debug_log(f"组重命名: {group_rename_count} 个频道组", 'info')
-    
-    return output_lines, rename_count, sort_count, len(channels_data), group_rename_count, group_sort_count, group_rename_with_k_count
+                    if target_channels:
+                        should_sort_urls = name_match and group_match
+                    elif group_names:
+                        should_sort_urls = group_match
+                    else:
+                        should_sort_urls = True
+
+                # URL可能需要排序
+                if should_sort_urls and len(ch.urls) > 1:
+                    # 每个URL只算一次得分；得分全相同则稳定排序不会改变顺序，
+                    # 直接原样输出
+                    if urls_lc is not None:
+                        scores = [get_url_sort_score(u, ulc) for u, ulc in zip(ch.urls, urls_lc)]
+                    else:
+                        scores = [get_url_sort_score(u) for u in ch.urls]
+                    if min(scores) != max(scores):
+                        order = sorted(range(len(scores)), key=scores.__getitem__)
+                        sorted_list = [ch.urls[i] for i in order]
+                        final_urls = sorted_list
+                        if sorted_list != ch.urls:
+                            stats.sort_count += 1
+                            if _DEBUG:
+                                debug_log(f"  URL排序成功，排序变化计数: {stats.sort_count}", 'debug')
+
+            # 统一的尾部输出：EXTINF行 + URL列表
+            yield final_inf
+            yield from final_urls
+
+        debug_log(f"处理完成: 重命名 {stats.rename_count} 个频道, 排序 {stats.sort_count} 个频道", 'info')
+        debug_log(f"组重命名: {stats.group_rename_count} 个频道组", 'info')
+
+    def _counted(gen: Iterator[str]) -> Iterator[str]:
+        """消费时顺带统计输出行数"""
+        for line in gen:
+            stats.lines_written += 1
+            yield line
 
-def safe_write_output(lines: List[str], input_path: str, output_path: str) -> Tuple[bool, Optional[str]]:
-    """安全地写入输出文件"""
+    return _counted(_emit()), stats
+
+def safe_write_output(lines: Iterable[str], output_path: str,
+                      is_same_file: bool) -> Tuple[bool, Optional[str]]:
+    """安全地写入输出文件；lines 可以是生成器，边消费边写盘
+
+    is_same_file 由调用方判定一次传入（输入输出是否同一文件），
+    这里不再重复做路径规范化。
+    """
     debug_log(f"安全写入输出文件: {output_path}", 'info')
-    debug_log(f"输入路径: {input_path}", 'debug')
-    
-    input_abs = os.path.abspath(input_path)
-    output_abs = os.path.abspath(output_path)
-    is_same_file = input_abs == output_abs
-    
     debug_log(f"是否为同一文件: {is_same_file}", 'debug')
     
     temp_path = None
@@ -528,16 +606,16 @@ def safe_write_output(lines: List[str], input_path: str, output_path: str) -> Tu
             )
             debug_log(f"创建临时文件: {temp_path}", 'debug')
             
-            out_f = os.fdopen(fd, 'w', encoding='utf-8')
+            out_f = os.fdopen(fd, 'w', encoding='utf-8', buffering=1 << 20)
         else:
-            out_f = open(output_path, 'w', encoding='utf-8')
+            out_f = open(output_path, 'w', encoding='utf-8', buffering=1 << 20)
             debug_log(f"直接打开输出文件: {output_path}", 'debug')
-        
+
         with out_f:
-            for line in lines:
-                out_f.write(line + '\n')
-        
-        debug_log(f"写入完成，共 {len(lines)} 行", 'info')
+            # writelines 直接消费生成器，峰值内存只剩写缓冲
+            out_f.writelines(f'{line}\n' for line in lines)
+
+        debug_log("写入完成", 'info')
         
         if is_same_file:
             try:
@@ -635,7 +713,10 @@ def main():
             global LOG_LEVEL
             LOG_LEVEL = 'debug'
             debug_log("通过 --verbose 参数启用详细输出", 'info')
-        
+
+        # 调试相关全局量可能被上面改写，重算热路径开关
+        _refresh_debug_flag()
+
         debug_log("参数解析完成", 'info')
         
         # 验证参数
@@ -647,11 +728,11 @@ def main():
             sys.exit(1)
         debug_log("参数验证通过", 'info')
         
-        # 检查输出文件
-        input_abs = os.path.abspath(args.input)
-        output_abs = os.path.abspath(args.output)
-        
-        if os.path.exists(args.output) and input_abs != output_abs:
+        # 检查输出文件；samefile 只判定一次，后续写入直接复用结果
+        output_exists = os.path.exists(args.output)
+        is_same_file = output_exists and os.path.samefile(args.input, args.output)
+
+        if output_exists and not is_same_file:
             if not args.force:
                 print(f"❌ 错误：输出文件 '{args.output}' 已存在")
                 print("   使用 --force 参数强制覆盖，或指定不同的输出文件")
@@ -663,18 +744,16 @@ def main():
         debug_log("开始处理M3U文件", 'info')
         
         try:
-            output_lines, rename_count, sort_count, total_channels, group_rename_count, group_sort_count, group_rename_with_k_count = sort_m3u_urls(
-                args.input, args.output, args.keywords, args.reverse, 
+            output_lines, stats = sort_m3u_urls(
+                args.input, args.output, args.keywords, args.reverse,
                 args.channels, args.rename, args.force,
                 args.groups, args.rename_group, args.group_sort
             )
-            
+
             if output_lines is None:
                 print("❌ 处理失败：sort_m3u_urls 返回 None")
                 sys.exit(1)
-            
-            debug_log(f"处理完成，生成 {len(output_lines)} 行输出", 'info')
-            
+
         except Exception as e:
             log_exception(e, "处理M3U文件")
             print("❌ 处理M3U文件时发生错误，请检查输入文件格式和参数")
@@ -685,12 +764,14 @@ def main():
         # 安全写入输出文件
         debug_log("开始写入输出文件", 'info')
         try:
-            success, temp_path = safe_write_output(output_lines, args.input, args.output)
+            success, temp_path = safe_write_output(output_lines, args.output, is_same_file)
             
             if not success:
                 cleanup_temp_file(temp_path)
                 print("❌ 写入输出文件失败")
                 sys.exit(1)
+
+            debug_log(f"处理完成，生成 {stats.lines_written} 行输出", 'info')
         except Exception as e:
             log_exception(e, "写入输出文件")
             print("❌ 写入输出文件时发生错误")
@@ -704,14 +785,14 @@ def main():
         if args.rename or args.rename_group:
             print(f"\n📝 重命名模式结果:")
             if args.rename:
-                print(f"   频道重命名: {rename_count} 个频道已重命名为 '{args.rename}'")
+                print(f"   频道重命名: {stats.rename_count} 个频道已重命名为 '{args.rename}'")
             if args.rename_group:
-                print(f"   频道组重命名: {group_rename_count} 个频道的组名已修改为 '{args.rename_group}'")
+                print(f"   频道组重命名: {stats.group_rename_count} 个频道的组名已修改为 '{args.rename_group}'")
         else:
             print(f"\n🔄 排序模式结果:")
             if args.keywords:
-                print(f"   URL排序: {sort_count} 个频道的URL已按 '{args.keywords}' 排序")
-            if args.group_sort and group_sort_count:
+                print(f"   URL排序: {stats.sort_count} 个频道的URL已按 '{args.keywords}' 排序")
+            if args.group_sort and stats.group_sort_count:
                 if args.reverse:
                     print(f"   组间排序: 频道组已按照 '{args.groups}' 反向排列（匹配的组在后）")
                 else:
@@ -720,14 +801,14 @@ def main():
         print(f"\n📊 统计信息:")
         print(f"   输入文件: {args.input}")
         print(f"   输出文件: {args.output}")
-        print(f"   频道总数: {total_channels} 个")
+        print(f"   频道总数: {stats.total_channels} 个")
         
         if DEBUG_MODE:
             print(f"\n🔍 调试信息:")
-            print(f"   处理的行数: {len(output_lines)}")
+            print(f"   处理的行数: {stats.lines_written}")
             print(f"   临时文件: {'已清理' if temp_path is None else '存在'}")
         
-        if input_abs == output_abs:
+        if is_same_file:
             print(f"\n⚠️  注意: 已安全覆盖原文件")
         
         debug_log("脚本执行完成", 'info')